@@ -1,17 +1,31 @@
+import numpy as np
+
+from typing import List, Union
+
 from langchain_core.tools import tool
 
 @tool
-def convert_temperature_fahrenheit_to_celsius(fahrenheit_temperature: int) -> int:
+def convert_temperature_fahrenheit_to_celsius(
+        fahrenheit_temperature: Union[int, List[int]]) -> Union[int, List[int]]:
     """
     Convert a given temperature from Fahrenheit to Celsius.
 
     This function takes a temperature value in Fahrenheit and converts it into
     its equivalent in Celsius using the standard formula. The output temperature
-    is rounded to the nearest integer.
+    is rounded to the nearest integer. A list of temperatures (e.g. a column
+    from an extracted table) is converted in a single vectorised pass.
 
-    :param fahrenheit_temperature: The temperature in Fahrenheit to be converted.
-    :type fahrenheit_temperature: int
-    :return: The equivalent temperature in Celsius, rounded to the nearest integer.
-    :rtype: int
+    :param fahrenheit_temperature: The temperature in Fahrenheit to be converted,
+        or a list of temperatures.
+    :type fahrenheit_temperature: int | list[int]
+    :return: The equivalent temperature in Celsius, rounded to the nearest integer,
+        or a list of converted temperatures.
+    :rtype: int | list[int]
     """
-    return round((fahrenheit_temperature - 32) * 5 / 9)
\ No newline at end of file
+    # Single values are the common case; plain float arithmetic avoids the
+    # cost of building a NumPy array for one number
+    if isinstance(fahrenheit_temperature, (int, float)):
+        return round((fahrenheit_temperature - 32) * 5 / 9)
+    temperatures = np.asarray(fahrenheit_temperature, dtype=np.float64)
+    # np.rint rounds half to even, matching the built-in round()
+    return np.rint((temperatures - 32) * 5 / 9).astype(np.int64).tolist()
@@ -1,46 +1,65 @@
+import numpy as np
+
+from typing import List, Union
+
 from langchain_core.tools import tool
 
+
+def _convert(values, factor: float) -> Union[int, List[int]]:
+    # Single values are the common case; plain float arithmetic avoids the
+    # cost of building a NumPy array for one number
+    if isinstance(values, (int, float)):
+        return round(values * factor)
+    # np.rint rounds half to even, matching the built-in round()
+    return np.rint(np.asarray(values, dtype=np.float64) * factor).astype(np.int64).tolist()
+
 @tool
-def convert_length_inches_to_cm(inches_length: int) -> int:
+def convert_length_inches_to_cm(
+        inches_length: Union[int, List[int]]) -> Union[int, List[int]]:
     """
     Converts a given length from inches to centimeters.
 
     This function takes a length measurement in inches and converts it to centimeters
     using the conversion factor of 2.54. The resulting value is rounded to the nearest
-    integer and returned.
+    integer and returned. A list of lengths is converted in a single vectorised pass.
 
-    :param inches_length: The length in inches to be converted
-    :type inches_length: int
-    :return: The length converted to centimeters, rounded to the nearest integer
-    :rtype: int
+    :param inches_length: The length in inches to be converted, or a list of lengths
+    :type inches_length: int | list[int]
+    :return: The length converted to centimeters, rounded to the nearest integer,
+        or a list of converted lengths
+    :rtype: int | list[int]
     """
-    return round(inches_length * 2.54)
+    return _convert(inches_length, 2.54)
 
 @tool
-def convert_weight_cups_to_grams(cups_weight: float) -> int:
+def convert_weight_cups_to_grams(
+        cups_weight: Union[float, List[float]]) -> Union[int, List[int]]:
     """
     Converts weight from cups to grams. This function accepts a weight in cups and
     returns the equivalent weight in grams. It assumes a standard conversion
-    rate of 1 cup = 250 grams.
+    rate of 1 cup = 250 grams. A list of weights is converted in a single
+    vectorised pass.
 
-    :param cups_weight: The weight in cups
-    :type cups_weight: float
-    :return: The equivalent weight in grams
-    :rtype: int
+    :param cups_weight: The weight in cups, or a list of weights
+    :type cups_weight: float | list[float]
+    :return: The equivalent weight in grams, or a list of weights
+    :rtype: int | list[int]
     """
-    return round(cups_weight * 250)
+    return _convert(cups_weight, 250)
 
 @tool
-def convert_volume_cups_to_millilitres(cups_volume: float) -> int:
+def convert_volume_cups_to_millilitres(
+        cups_volume: Union[float, List[float]]) -> Union[int, List[int]]:
     """
     This function takes a floating-point value representing the volume in cups
     and converts it into millilitres by multiplying with a conversion factor of 240.
     The result is rounded to the nearest integer to ensure accurate representation
-    of the millilitres value.
+    of the millilitres value. A list of volumes is converted in a single
+    vectorised pass.
 
-    :param cups_volume: The volume in cups to be converted.
-    :type cups_volume: float
-    :return: The equivalent volume in ml.
-    :rtype: int
+    :param cups_volume: The volume in cups to be converted, or a list of volumes.
+    :type cups_volume: float | list[float]
+    :return: The equivalent volume in ml, or a list of volumes.
+    :rtype: int | list[int]
     """
-    return round(cups_volume * 240)
+    return _convert(cups_volume, 240)
@@ -1,9 +1,18 @@
-import base64
+try:
+    # SIMD-accelerated base64 with the same API as the standard library
+    import pybase64 as base64
+except ImportError:
+    import base64
 import numpy as np
 import tempfile
+import threading
 import os
+import uuid
 import cv2
 
+from functools import lru_cache
+from typing import Dict, Tuple
+
 from langchain_core.messages import HumanMessage
 from langchain_core.tools import tool
 from langchain_openai import ChatOpenAI
@@ -11,33 +20,78 @@ from langchain_ollama import ChatOllama
 
 from dotenv import load_dotenv
 
-load_dotenv()
-#vision_llm = ChatOpenAI(model="gpt-4o")
-vision_llm = ChatOllama(model = "qwen2.5vl")
+# Child processes inherit the parsed environment, so only parse .env once
+if not os.getenv("_DOTENV_LOADED"):
+    load_dotenv()
+    os.environ["_DOTENV_LOADED"] = "1"
 
-@tool
-def extract_text(img_path: str) -> str:
+# Images that callers hold in memory (e.g. downloads), addressed by keys with
+# this prefix so they can be passed to extract_text in place of a file path
+MEMORY_IMAGE_PREFIX = "mem://"
+_memory_images: Dict[str, Tuple[bytes, str]] = {}
+_memory_images_lock = threading.Lock()
+
+# Canonical MIME type for each supported image file extension. mimetypes is
+# not used because it does not know .webp on every Python version
+IMAGE_MIME_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".gif": "image/gif",
+    ".bmp": "image/bmp",
+    ".tiff": "image/tiff",
+    ".webp": "image/webp"
+}
+
+
+@lru_cache(maxsize=1)
+def get_vision_llm():
     """
-    Extracts text from an image specified by its file path. This function reads the
-    image file, encodes the image data as base64, sends the image content to a
-    vision-capable language model to extract text, and returns the resulting text
-    content.
+    Returns the vision-capable model used by the text extraction tools. The
+    model is created on first use, so importing this module stays cheap for
+    code paths that never extract text.
+    """
+    #return ChatOpenAI(model="gpt-4o")
+    return ChatOllama(model = "qwen2.5vl")
 
-    :param img_path: The file path of the image from which text is to be extracted.
-    :type img_path: str
+
+@lru_cache(maxsize=1)
+def warm_up_vision_llm() -> None:
+    """
+    Starts loading the vision model in a background thread. The first request to
+    a local model pays its full load time, so sending a tiny prompt early lets
+    that overlap with the caller's own setup work (downloading or reading the
+    image). Failures are ignored; the real request will surface them. Only the
+    first call in a process does anything, so callers that loop over images
+    do not send one warm-up prompt per image.
+    """
+    def _warm():
+        try:
+            get_vision_llm().invoke([HumanMessage(content="hi")])
+        except Exception:
+            pass  # Warm-up is best effort
+
+    threading.Thread(target=_warm, daemon=True).start()
+
+
+def extract_text_from_bytes(image_bytes: bytes, mime_type: str = "image/png") -> str:
+    """
+    Extracts text from in-memory image data. This is the shared core of
+    :func:`extract_text`; callers that already hold the encoded image can use
+    it directly.
+
+    :param image_bytes: The encoded image data (e.g. PNG or JPEG bytes).
+    :type image_bytes: bytes
+    :param mime_type: The MIME type of the image data.
+    :type mime_type: str
     :return: Extracted text from the image, or an empty string if an error occurs
         during the process.
     :rtype: str
-    :raises Exception: If any error occurs during image reading, encoding,
-        or processing the response from the model.
     """
     all_text = ""
     try:
-        # Read image and encode as base64
-        with open(img_path, "rb") as image_file:
-            image_bytes = image_file.read()
-
-        image_base64 = base64.b64encode(image_bytes).decode("utf-8")
+        # Base64 output is pure ASCII, which decodes faster than UTF-8
+        image_base64 = base64.b64encode(image_bytes).decode("ascii")
 
         # Prepare the prompt including the base64 image data
         message = [
@@ -53,7 +107,7 @@ def extract_text(img_path: str) -> str:
                     {
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:image/png;base64,{image_base64}"
+                            "url": f"data:{mime_type};base64,{image_base64}"
                         }
                     }
                 ]
@@ -61,7 +115,7 @@ def extract_text(img_path: str) -> str:
         ]
 
         # Call the vision-capable model
-        response = vision_llm.invoke(message)
+        response = get_vision_llm().invoke(message)
 
         # Append extracted text
         all_text += response.content + "\n\n"
@@ -71,4 +125,79 @@ def extract_text(img_path: str) -> str:
     except Exception as e:
         error_msg = f"Error extracting text: {str(e)}"
         print(error_msg)
-        return ""
\ No newline at end of file
+        return ""
+
+
+def register_image_bytes(image_bytes: bytes, mime_type: str = "image/png") -> str:
+    """
+    Keeps image data in memory and returns a key that :func:`extract_text`
+    accepts in place of a file path. This lets callers that already hold the
+    image (such as a download) skip writing it to disk and reading it back.
+    Release the key with :func:`release_image_bytes` when done.
+
+    :param image_bytes: The encoded image data (e.g. PNG or JPEG bytes).
+    :type image_bytes: bytes
+    :param mime_type: The MIME type of the image data.
+    :type mime_type: str
+    :return: A key of the form ``mem://<id>``.
+    :rtype: str
+    """
+    key = f"{MEMORY_IMAGE_PREFIX}{uuid.uuid4().hex}"
+    with _memory_images_lock:
+        _memory_images[key] = (image_bytes, mime_type)
+    return key
+
+
+def release_image_bytes(key: str) -> None:
+    """
+    Drops image data registered with :func:`register_image_bytes`. Unknown keys
+    are ignored.
+
+    :param key: The key returned by :func:`register_image_bytes`.
+    :type key: str
+    """
+    with _memory_images_lock:
+        _memory_images.pop(key, None)
+
+
+@tool
+def extract_text(img_path: str) -> str:
+    """
+    Extracts text from an image specified by its file path. This function reads the
+    image file, encodes the image data as base64, sends the image content to a
+    vision-capable language model to extract text, and returns the resulting text
+    content. Images held in memory are given by their ``mem://`` key instead of a
+    path.
+
+    :param img_path: The file path (or ``mem://`` key) of the image from which
+        text is to be extracted.
+    :type img_path: str
+    :return: Extracted text from the image, or an empty string if an error occurs
+        during the process.
+    :rtype: str
+    :raises Exception: If any error occurs during image reading, encoding,
+        or processing the response from the model.
+    """
+    if img_path.startswith(MEMORY_IMAGE_PREFIX):
+        with _memory_images_lock:
+            entry = _memory_images.get(img_path)
+        if entry is None:
+            print(f"Error extracting text: unknown in-memory image {img_path}")
+            return ""
+        return extract_text_from_bytes(*entry)
+
+    try:
+        # Read image bytes; encoding and the model call happen in memory
+        with open(img_path, "rb") as image_file:
+            image_bytes = image_file.read()
+
+    except Exception as e:
+        error_msg = f"Error extracting text: {str(e)}"
+        print(error_msg)
+        return ""
+
+    # Label the data with the file's real type; PNG for unknown extensions
+    extension = os.path.splitext(img_path)[1].lower()
+    return extract_text_from_bytes(
+        image_bytes, IMAGE_MIME_TYPES.get(extension, "image/png")
+    )
@@ -10,6 +10,8 @@ import sys
 import time
 import requests
 import json
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Note about model choices:
@@ -19,10 +21,16 @@ from pathlib import Path
 # - bakllava:7b: Alternative LLaVA implementation with tool support
 # We prioritize models that support function calling since our OCR agent uses tools
 
+# One pooled session for every Ollama API call, so the status checks, model
+# listing and (parallel) model tests reuse connections instead of opening
+# a new one per request
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+
 def check_ollama_running():
     """Check if Ollama service is running."""
     try:
-        response = requests.get("http://localhost:11434/api/tags", timeout=5)
+        response = _SESSION.get("http://localhost:11434/api/tags", timeout=5)
         return response.status_code == 200
     except requests.exceptions.RequestException:
         return False
@@ -83,7 +91,7 @@ def start_ollama():
 def list_ollama_models():
     """List available Ollama models."""
     try:
-        response = requests.get("http://localhost:11434/api/tags", timeout=10)
+        response = _SESSION.get("http://localhost:11434/api/tags", timeout=10)
         if response.status_code == 200:
             models = response.json().get("models", [])
             return [model["name"] for model in models]
@@ -171,7 +179,7 @@ def test_model(model_name="llava:7b"):
             "stream": False
         }
         
-        response = requests.post(
+        response = _SESSION.post(
             "http://localhost:11434/api/generate",
             json=payload,
             timeout=30
@@ -179,15 +187,15 @@ def test_model(model_name="llava:7b"):
         
         if response.status_code == 200:
             result = response.json()
-            print(f"✅ Model test successful!")
+            print(f"✅ Model {model_name} test successful!")
             print(f"   Response: {result.get('response', 'No response')}")
             return True
         else:
-            print(f"❌ Model test failed: {response.status_code}")
+            print(f"❌ Model {model_name} test failed: {response.status_code}")
             return False
             
     except Exception as e:
-        print(f"❌ Model test error: {e}")
+        print(f"❌ Model {model_name} test error: {e}")
         return False
 
 def install_ollama_instructions():
@@ -257,31 +265,65 @@ def main():
     print("   Fallback models available if needed")
     print("=" * 50)
     
-    # Setup Ollama and model
-    possible_models = [
-        "llava:7b",       # LLaVA 7B model (supports tools)
-        "bakllava:7b",    # BakLLaVA model (supports tools) 
-        "llava:13b",      # Larger LLaVA model (fallback)
-        "moondream",      # Small model but no tool support
-    ]
-    
     success = False
     used_model = None
     
-    for model in possible_models:
-        print(f"\n🔄 Trying model: {model}")
-        if setup_ollama_with_model(model):
-            # Test the model
-            if test_model(model):
-                print(f"\n🎉 Ollama setup completed successfully with {model}!")
-                print(f"💡 You can now use: --provider ollama --model {model}")
-                used_model = model
-                success = True
-                break
+    # Step 1: Make sure the service is up before querying it
+    if not check_ollama_running():
+        print("⚠️  Ollama service not running")
+        if not start_ollama():
+            print("\n❌ All model attempts failed")
+            return False
+    
+    # Step 2: Test every candidate that is already downloaded at once, so
+    # a slow or broken model does not hold up the others
+    available_models = list_ollama_models()
+    local_candidates = [
+        model for model in possible_models
+        # Exact match: a substring test would count "bakllava:7b" as "llava:7b"
+        if model in available_models or f"{model}:latest" in available_models
+    ]
+    
+    if local_candidates:
+        print(f"\n📋 Testing local models: {', '.join(local_candidates)}")
+        with ThreadPoolExecutor(max_workers=len(local_candidates)) as executor:
+            results = dict(zip(local_candidates,
+                               executor.map(test_model, local_candidates)))
+        # Respect the priority order among the models that passed
+        used_model = next(
+            (model for model in local_candidates if results[model]), None
+        )
+        # Ollama may queue the parallel requests behind one another, so a
+        # failure can be a timeout rather than a broken model; retry those
+        # one at a time before downloading anything
+        if used_model is None and len(local_candidates) > 1:
+            print("\n🔁 Retrying local models one at a time...")
+            used_model = next(
+                (model for model in local_candidates if test_model(model)), None
+            )
+        success = used_model is not None
+        if success:
+            print(f"\n🎉 Ollama setup completed successfully with {used_model}!")
+            print(f"💡 You can now use: --provider ollama --model {used_model}")
+    
+    # Step 3: Only download when no local model works
+    if not success:
+        for model in possible_models:
+            if model in local_candidates:
+                continue
+            print(f"\n🔄 Trying model: {model}")
+            if setup_ollama_with_model(model):
+                # Test the model
+                if test_model(model):
+                    print(f"\n🎉 Ollama setup completed successfully with {model}!")
+                    print(f"💡 You can now use: --provider ollama --model {model}")
+                    used_model = model
+                    success = True
+                    break
+                else:
+                    print(f"\n⚠️  Model {model} downloaded but test failed, trying next...")
             else:
-                print(f"\n⚠️  Model {model} downloaded but test failed, trying next...")
-        else:
-            print(f"\n❌ Failed to setup {model}, trying next...")
+                print(f"\n❌ Failed to setup {model}, trying next...")
     
     if success:
         print(f"\n✅ Final model selected: {used_model}")
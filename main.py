@@ -6,17 +6,22 @@ Supports OpenAI GPT-4o, Ollama LLaVA, and Hugging Face SmolVLM for
 extracting text from images (local files or URLs).
 """
 
+import asyncio
+import importlib.util
+import logging
 import os
 import sys
 import tempfile
-import urllib.error
 import urllib.parse
-import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Annotated, Any, Dict, List, Optional, TypedDict, Union
+from typing import (
+    Annotated, Any, Dict, List, Optional, Tuple, TypedDict, Union
+)
 
 import typer
-from dotenv import load_dotenv
+import urllib3
 from langchain_core.messages import AnyMessage, HumanMessage, SystemMessage
 from langchain_ollama import ChatOllama
 from langchain_openai import ChatOpenAI
@@ -24,9 +29,15 @@ from langgraph.graph import START, StateGraph
 from langgraph.graph.message import add_messages
 from langgraph.prebuilt import ToolNode, tools_condition
 
-from agent.tools import extract_text
+# Importing agent.tools also loads .env (once per process tree), before the
+# settings below are read from the environment
+from agent.tools import (
+    IMAGE_MIME_TYPES, MEMORY_IMAGE_PREFIX, extract_text, register_image_bytes,
+    release_image_bytes, warm_up_vision_llm
+)
 
-load_dotenv()
+# Progress messages; configured in main_command, silent when used as a library
+log = logging.getLogger("ocr_agent")
 
 # Constants
 DEFAULT_MODELS = {
@@ -39,8 +50,49 @@ VALID_IMAGE_EXTENSIONS = {
     '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp'
 }
 
+# File extension for each image MIME type (content-type without parameters)
+_MIME_TO_EXT = {
+    'image/jpeg': '.jpg',
+    'image/jpg': '.jpg',
+    'image/png': '.png',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+    'image/bmp': '.bmp',
+    'image/tiff': '.tiff'
+}
+
 DOWNLOAD_TIMEOUT = 30
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
 MAX_TOKENS = 1000
+BATCH_MAX_WORKERS = 8
+HF_BATCH_SIZE = 4
+
+# Set SMOLVLM_LOAD_IN_8BIT=1 to load the SmolVLM weights as int8 via
+# bitsandbytes (CUDA only), halving weight memory and bandwidth in the
+# decode loop
+SMOLVLM_LOAD_IN_8BIT = os.getenv("SMOLVLM_LOAD_IN_8BIT", "0") == "1"
+
+# Downloaded images live in the system temp dir under this prefix; only
+# files matching both are ever deleted by cleanup_temp_file
+TEMP_FILE_PREFIX = 'ocr_image_'
+_TEMP_DIR = os.path.realpath(tempfile.gettempdir()) + os.sep
+
+# Headers to mimic browser request
+DOWNLOAD_HEADERS = {
+    'User-Agent': ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
+                  'AppleWebKit/537.36 (KHTML, like Gecko) '
+                  'Chrome/91.0.4472.124 Safari/537.36')
+}
+
+# Shared connection pool so repeated downloads from the same host reuse
+# their TCP/TLS connections instead of handshaking for every image. Retry
+# transient connect/read failures, and follow redirects as far as
+# urllib.request did (10); a total= limit would count redirects as retries
+_POOL = urllib3.PoolManager(
+    num_pools=16,
+    maxsize=32,
+    retries=urllib3.Retry(connect=2, read=2, redirect=10, backoff_factor=0.3)
+)
 
 # Type definitions
 class AgentState(TypedDict):
@@ -58,16 +110,23 @@ app = typer.Typer(
 tools = [extract_text]
 
 
+@lru_cache(maxsize=8)
 def get_llm_with_tools(
     model_provider: str, 
-    model_name: str
+    model_name: str,
+    parallel_tool_calls: bool = True
 ) -> Union[str, ChatOpenAI, ChatOllama]:
     """
     Get LLM with tools based on provider and model name.
     
+    Instances are cached per arguments, so every caller shares one client
+    and its HTTP keep-alive pool.
+    
     Args:
         model_provider: The AI provider ('openai', 'ollama', 'huggingface')
         model_name: Specific model name to use
+        parallel_tool_calls: Let OpenAI request several tool calls in one
+            response; they are then executed concurrently by the tool node
         
     Returns:
         Configured LLM instance or placeholder for huggingface
@@ -79,7 +138,7 @@ def get_llm_with_tools(
     
     if provider == "openai":
         llm = ChatOpenAI(model=model_name)
-        return llm.bind_tools(tools, parallel_tool_calls=False)
+        return llm.bind_tools(tools, parallel_tool_calls=parallel_tool_calls)
     elif provider == "ollama":
         llm = ChatOllama(model=model_name, temperature=0.7)
         return llm.bind_tools(tools)
@@ -143,13 +202,39 @@ def create_graph(llm_with_tools) -> StateGraph:
     
     builder = StateGraph(AgentState)
     builder.add_node("assistant", assistant_with_llm)
-    builder.add_node("tools", ToolNode(tools))
+    # ToolNode runs the tool calls of one response concurrently; report tool
+    # failures back to the model instead of aborting the whole run
+    builder.add_node("tools", ToolNode(tools, handle_tool_errors=True))
     builder.add_edge(START, "assistant")
     builder.add_conditional_edges("assistant", tools_condition)
     builder.add_edge("tools", "assistant")
     return builder.compile()
 
 
+@lru_cache(maxsize=4)
+def _get_compiled_graph(
+    provider: str,
+    model: str,
+    parallel_tools: bool = True
+) -> StateGraph:
+    """
+    Build the LLM and compiled graph for a provider/model once per process.
+    
+    Reusing them keeps the LLM client's HTTP connection pool warm across
+    images and skips recompiling the graph.
+    
+    Args:
+        provider: AI provider to use
+        model: Specific model name to use
+        parallel_tools: Allow parallel tool calls (OpenAI only)
+        
+    Returns:
+        Compiled StateGraph ready for execution
+    """
+    llm_with_tools = get_llm_with_tools(provider, model, parallel_tools)
+    return create_graph(llm_with_tools)
+
+
 def is_url(string: str) -> bool:
     """
     Check if a string is a valid URL.
@@ -160,10 +245,13 @@ def is_url(string: str) -> bool:
     Returns:
         True if string is a valid URL, False otherwise
     """
+    # Only http(s) URLs can be downloaded; a prefix test rejects local paths
+    # without building a parse result. Schemes are case-insensitive
+    if not string[:8].lower().startswith(("http://", "https://")):
+        return False
     try:
-        result = urllib.parse.urlparse(string)
-        return all([result.scheme, result.netloc])
-    except Exception:
+        return bool(urllib.parse.urlsplit(string).netloc)
+    except ValueError:
         return False
 
 
@@ -181,19 +269,15 @@ def get_image_extension(
     Returns:
         File extension (e.g., '.jpg', '.png')
     """
-    # Check content type first
-    if 'jpeg' in content_type or 'jpg' in content_type:
-        return '.jpg'
-    elif 'png' in content_type:
-        return '.png'
-    elif 'gif' in content_type:
-        return '.gif'
-    elif 'webp' in content_type:
-        return '.webp'
+    # Check content type first, e.g. 'image/png; charset=binary'
+    mime_type = content_type.split(';', 1)[0].strip().lower()
+    ext = _MIME_TO_EXT.get(mime_type)
+    if ext is not None:
+        return ext
     
     # Fall back to URL path extension
-    parsed_url = urllib.parse.urlparse(url)
-    path_ext = Path(parsed_url.path).suffix.lower()
+    parsed_url = urllib.parse.urlsplit(url)
+    path_ext = os.path.splitext(parsed_url.path)[1].lower()
     
     if path_ext in VALID_IMAGE_EXTENSIONS:
         return path_ext
@@ -201,6 +285,52 @@ def get_image_extension(
     return '.jpg'  # Default fallback
 
 
+def _open_image_url(url: str) -> Tuple[Any, str, str]:
+    """
+    Start downloading an image, leaving the body to be streamed by the caller.
+    
+    Args:
+        url: The URL of the image to download
+        
+    Returns:
+        Tuple of (open response, file extension, MIME type). The caller
+        must call release_conn() on the response when done.
+        
+    Raises:
+        Exception: If the request fails
+    """
+    log.info("📥 Downloading image from URL...")
+    
+    try:
+        response = _POOL.request(
+            "GET",
+            url,
+            headers=DOWNLOAD_HEADERS,
+            timeout=DOWNLOAD_TIMEOUT,
+            preload_content=False
+        )
+    except urllib3.exceptions.MaxRetryError as e:
+        raise Exception(f"URL error: {e.reason}")
+    except urllib3.exceptions.HTTPError as e:
+        raise Exception(f"URL error: {str(e)}")
+    
+    if response.status >= 400:
+        response.release_conn()
+        raise Exception(f"HTTP error {response.status}: {response.reason}")
+    
+    content_type = response.headers.get('content-type', '')
+    ext = get_image_extension(url, content_type)
+    
+    # Trust the server's image type; otherwise (e.g. octet-stream) use the
+    # type matching the extension picked from the URL
+    mime_type = content_type.split(';', 1)[0].strip().lower()
+    if mime_type in _MIME_TO_EXT:
+        mime_type = IMAGE_MIME_TYPES[_MIME_TO_EXT[mime_type]]  # image/jpg -> jpeg
+    else:
+        mime_type = IMAGE_MIME_TYPES.get(ext, 'image/jpeg')
+    return response, ext, mime_type
+
+
 def download_image_from_url(url: str) -> str:
     """
     Download an image from a URL and save it to a temporary file.
@@ -214,98 +344,341 @@ def download_image_from_url(url: str) -> str:
     Raises:
         Exception: If download fails
     """
-    typer.echo("📥 Downloading image from URL...")
-    
-    # Headers to mimic browser request
-    headers = {
-        'User-Agent': ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
-                      'AppleWebKit/537.36 (KHTML, like Gecko) '
-                      'Chrome/91.0.4472.124 Safari/537.36')
-    }
+    response, ext, _ = _open_image_url(url)
     
     try:
-        req = urllib.request.Request(url, headers=headers)
+        # Create temporary file
+        temp_fd, temp_path = tempfile.mkstemp(
+            suffix=ext, 
+            prefix=TEMP_FILE_PREFIX
+        )
         
-        with urllib.request.urlopen(req, timeout=DOWNLOAD_TIMEOUT) as response:
-            content_type = response.headers.get('content-type', '')
-            ext = get_image_extension(url, content_type)
-            
-            # Create temporary file
-            temp_fd, temp_path = tempfile.mkstemp(
-                suffix=ext, 
-                prefix='ocr_image_'
-            )
-            
-            try:
-                with os.fdopen(temp_fd, 'wb') as temp_file:
-                    temp_file.write(response.read())
-                
-                typer.echo(f"✅ Image downloaded: {Path(temp_path).name}")
-                return temp_path
-                
-            except Exception:
-                Path(temp_path).unlink(missing_ok=True)
-                raise
-                
-    except urllib.error.HTTPError as e:
-        raise Exception(f"HTTP error {e.code}: {e.reason}")
-    except urllib.error.URLError as e:
-        raise Exception(f"URL error: {e.reason}")
+        try:
+            # Stream to disk in fixed-size chunks rather than buffering the
+            # whole body, so peak memory stays at one chunk per download.
+            # Content decoding stays on: servers may gzip the body
+            with os.fdopen(temp_fd, 'wb') as temp_file:
+                for chunk in response.stream(DOWNLOAD_CHUNK_SIZE):
+                    temp_file.write(chunk)
+        except Exception as e:
+            Path(temp_path).unlink(missing_ok=True)
+            raise Exception(f"Download failed: {str(e)}")
+        
+        log.info(f"✅ Image downloaded: {Path(temp_path).name}")
+        return temp_path
+    
+    finally:
+        # Hand the connection back to the pool for the next download
+        response.release_conn()
+
+
+def download_image_bytes(url: str) -> Tuple[bytes, str, str]:
+    """
+    Download an image from a URL into memory.
+    
+    Args:
+        url: The URL of the image to download
+        
+    Returns:
+        Tuple of (image bytes, file extension, MIME type)
+        
+    Raises:
+        Exception: If download fails
+    """
+    response, ext, mime_type = _open_image_url(url)
+    
+    try:
+        data = response.read()
     except Exception as e:
         raise Exception(f"Download failed: {str(e)}")
+    finally:
+        response.release_conn()
+    
+    log.info(f"✅ Image downloaded: {len(data)} bytes")
+    return data, ext, mime_type
+
+
+def download_image_to_memory(url: str) -> str:
+    """
+    Download an image and register it for the extract_text tool.
+    
+    Tool-based providers send images to the model as base64 anyway, so
+    keeping the download in memory skips a temp file write and read.
+    
+    Args:
+        url: The URL of the image to download
+        
+    Returns:
+        In-memory image key, usable wherever an image path is expected by
+        the agent; release it with cleanup_temp_file
+        
+    Raises:
+        Exception: If download fails
+    """
+    data, _, mime_type = download_image_bytes(url)
+    return register_image_bytes(data, mime_type)
 
 
 def cleanup_temp_file(file_path: str) -> None:
     """
-    Clean up temporary file if it exists.
+    Clean up temporary file (or in-memory image) if it exists.
     
     Args:
-        file_path: Path to temporary file
+        file_path: Path to temporary file, or an in-memory image key
     """
+    if not file_path:
+        return
+    
+    if file_path.startswith(MEMORY_IMAGE_PREFIX):
+        release_image_bytes(file_path)
+        return
+    
     try:
-        path = Path(file_path)
-        temp_dir = Path(tempfile.gettempdir())
-        
-        if file_path and path.exists() and temp_dir in path.parents:
-            path.unlink()
-    except Exception:
+        real_path = os.path.realpath(file_path)
+        if (real_path.startswith(_TEMP_DIR) and
+                os.path.basename(real_path).startswith(TEMP_FILE_PREFIX)):
+            os.unlink(real_path)
+    except OSError:
         pass  # Silent cleanup failure
 
 
-def process_huggingface_model(
-    image_path: str, 
-    prompt: str, 
-    model: str
-) -> None:
+@lru_cache(maxsize=2)
+def _load_smolvlm(
+    model: str,
+    device: str,
+    dtype: str,
+    compile_model: bool = False
+) -> Tuple[Any, Any]:
     """
-    Process image using Hugging Face SmolVLM model.
+    Load the SmolVLM processor and model, caching them for later calls.
+    
+    Loading reads gigabytes of weights, so it happens once per process
+    rather than once per image.
+    
+    Args:
+        model: Model name to load
+        device: 'cuda' or 'cpu'
+        dtype: Weight precision name ('bf16', 'fp16' or 'fp32'); a string keeps the
+            cache key hashable across torch versions
+        compile_model: Compile the model with torch.compile; the whole
+            forward pass when a static KV cache is available on CUDA,
+            otherwise the vision tower only
+        
+    Returns:
+        Tuple of (processor, vision_model)
+    """
+    from transformers import AutoProcessor, Idefics3ForConditionalGeneration
+    import torch
+    
+    log.info("🔄 Loading SmolVLM vision model...")
+    
+    if device == "cpu":
+        # One intra-op thread per physical core; SMT siblings share the
+        # vector units and only add contention
+        torch.set_num_threads(max((os.cpu_count() or 1) // 2, 1))
+    else:
+        # TF32 matmuls/convs on Ampere+ roughly double throughput for a
+        # mantissa loss that does not affect OCR output; let cuDNN pick the
+        # fastest conv algorithms for the fixed-size image tiles
+        torch.backends.cuda.matmul.allow_tf32 = True
+        torch.backends.cudnn.allow_tf32 = True
+        torch.backends.cudnn.benchmark = True
+    
+    torch_dtype = {
+        "bf16": torch.bfloat16,
+        "fp16": torch.float16,
+        "fp32": torch.float32
+    }[dtype]
+    # The fast (torchvision-backed) image processor batches resize/normalise
+    # as tensor ops instead of per-image PIL/numpy work
+    processor = AutoProcessor.from_pretrained(model, use_fast=True)
+    
+    quantization_config = None
+    if SMOLVLM_LOAD_IN_8BIT:
+        if (device == "cuda" and
+                importlib.util.find_spec("bitsandbytes") is not None):
+            from transformers import BitsAndBytesConfig
+            quantization_config = BitsAndBytesConfig(load_in_8bit=True)
+            log.info("🗜️  Quantizing weights to int8 (bitsandbytes)")
+        else:
+            log.warning("⚠️  SMOLVLM_LOAD_IN_8BIT needs CUDA and "
+                        "bitsandbytes; loading unquantized")
+    
+    # FlashAttention-2 when its CUDA kernels are installed, otherwise PyTorch's
+    # fused scaled-dot-product attention; both avoid materialising the full
+    # attention matrix the eager implementation builds
+    if device == "cuda" and importlib.util.find_spec("flash_attn") is not None:
+        attn_implementation = "flash_attention_2"
+    else:
+        attn_implementation = "sdpa"
+    log.info(f"🧩 Attention implementation: {attn_implementation}")
+    
+    vision_model = Idefics3ForConditionalGeneration.from_pretrained(
+        model,
+        dtype=torch_dtype,
+        # "balanced" spreads the layers evenly over every visible GPU rather
+        # than filling GPU 0 first; with one GPU it is the same as "auto"
+        device_map="balanced" if device == "cuda" else "cpu",
+        attn_implementation=attn_implementation,
+        quantization_config=quantization_config,
+        low_cpu_mem_usage=True,
+        trust_remote_code=True
+    )
+    vision_model.eval()
+    vision_model.generation_config.use_cache = True
+    
+    # The SigLIP vision tower is a conv patch embedding plus transformer
+    # layers run once per image tile, so it benefits from channels_last and
+    # compiles to a handful of fixed shapes
+    vision_tower = getattr(getattr(vision_model, "model", None),
+                           "vision_model", None)
+    if vision_tower is not None:
+        vision_tower.to(memory_format=torch.channels_last)
+    
+    # A static KV cache is allocated once at its final size, so decoding
+    # steps keep the same shapes instead of growing the cache every token.
+    # FlashAttention-2 manages its own variable-length KV layout and does not
+    # combine with the static cache in every transformers release.
+    # transformers has no public flag for static cache support, so the
+    # choice is logged
+    supports_static_cache = attn_implementation == "sdpa" and (
+        getattr(vision_model, "_supports_static_cache", False) or
+        getattr(vision_model, "_can_compile_fullgraph", False)
+    )
+    if supports_static_cache:
+        vision_model.generation_config.cache_implementation = "static"
+        log.info("🧱 KV cache: static")
+    elif attn_implementation != "sdpa":
+        log.info(f"🧱 KV cache: dynamic (static not supported with "
+                 f"{attn_implementation})")
+    else:
+        log.info("🧱 KV cache: dynamic (static not supported by this "
+                 "model/transformers)")
+    
+    # With fixed decoding shapes the whole per-token forward pass can be
+    # compiled on CUDA; with the growing cache it would recompile on every
+    # step, so only the vision tower is compiled then
+    if compile_model:
+        if quantization_config is not None:
+            # bitsandbytes int8 kernels do not trace under torch.compile
+            log.info("⚙️  Not compiling: int8 weights do not trace")
+        elif device == "cuda" and supports_static_cache:
+            log.info("⚙️  Compiling the full forward pass "
+                     "(first image will be slow)...")
+            vision_model.forward = torch.compile(
+                vision_model.forward,
+                mode="reduce-overhead",
+                fullgraph=False
+            )
+        elif vision_tower is not None:
+            reason = ("not on CUDA" if device != "cuda"
+                      else "dynamic KV cache")
+            log.info(f"⚙️  Compiling the vision tower only ({reason}; "
+                     "first image will be slow)...")
+            vision_tower.forward = torch.compile(
+                vision_tower.forward,
+                mode="reduce-overhead",
+                fullgraph=False
+            )
+        else:
+            log.warning("⚠️  Not compiling: no vision tower found and the "
+                        "full forward pass needs CUDA and a static KV cache")
+    
+    # Decoder-only generation continues from the last position, so batched
+    # prompts must be padded on the left
+    processor.tokenizer.padding_side = "left"
+    return processor, vision_model
+
+
+def _open_image_for_smolvlm(image_path: str, longest_edge: Optional[int]):
+    """
+    Open an image as RGB, no larger than the processor will resize it to.
     
     Args:
         image_path: Path to image file
+        longest_edge: Longest side the processor resizes images to, if known
+        
+    Returns:
+        RGB PIL image
+    """
+    from PIL import Image
+    
+    image = Image.open(image_path)
+    # libjpeg can scale by 1/2, 1/4 or 1/8 inside the IDCT; draft() picks the
+    # smallest scale that stays at or above the requested size, so the
+    # processor never sees fewer pixels than it would resize to anyway
+    if image.format == "JPEG" and longest_edge:
+        image.draft("RGB", (longest_edge, longest_edge))
+    image = image.convert("RGB")
+    # Other formats (and JPEGs draft() left larger) are shrunk to that size
+    # with a cheap bilinear pass, aspect ratio preserved, before the
+    # processor's own resize and normalise run on them
+    if longest_edge:
+        image.thumbnail((longest_edge, longest_edge), Image.BILINEAR)
+    return image
+
+
+def _smolvlm_device_dtype(cpu_dtype: str = "fp32") -> Tuple[str, str]:
+    """
+    Pick the device and weight precision SmolVLM runs with on this machine.
+    
+    GPUs without native bfloat16 (e.g. T4, V100) keep float16.
+    
+    Args:
+        cpu_dtype: Weight precision name to use when there is no GPU
+        
+    Returns:
+        Tuple of (device, dtype name) as taken by _load_smolvlm
+    """
+    import torch
+    
+    if not torch.cuda.is_available():
+        return "cpu", cpu_dtype
+    if torch.cuda.is_bf16_supported():
+        return "cuda", "bf16"
+    return "cuda", "fp16"
+
+
+def process_huggingface_model_batch(
+    image_paths: List[str], 
+    prompt: str, 
+    model: str,
+    compile_model: bool = False,
+    max_new_tokens: int = MAX_TOKENS,
+    cpu_dtype: str = "fp32"
+) -> List[str]:
+    """
+    Extract text from several images with one SmolVLM generate() call.
+    
+    Args:
+        image_paths: Paths to image files
         prompt: User prompt for processing
         model: Model name to use
+        compile_model: Compile the model with torch.compile
+        max_new_tokens: Most tokens to generate per image
+        cpu_dtype: Weight precision name to use when there is no GPU
+        
+    Returns:
+        Extracted text for each image, in input order
     """
-    typer.echo("🔄 Loading SmolVLM vision model...")
-    
     try:
-        from PIL import Image
-        from transformers import AutoProcessor, Idefics3ForConditionalGeneration
         import torch
         
-        # Load model and processor
-        processor = AutoProcessor.from_pretrained(model)
-        vision_model = Idefics3ForConditionalGeneration.from_pretrained(
-            model,
-            dtype=(torch.float16 if torch.cuda.is_available() 
-                   else torch.float32),
-            device_map="auto" if torch.cuda.is_available() else "cpu",
-            trust_remote_code=True
+        # Load model and processor (cached after the first image)
+        device, dtype = _smolvlm_device_dtype(cpu_dtype)
+        use_cuda = device == "cuda"
+        processor, vision_model = _load_smolvlm(
+            model, device, dtype, compile_model
         )
         
-        # Load and process image
-        image = Image.open(image_path)
+        # Load and process images
+        longest_edge = processor.image_processor.size.get("longest_edge")
+        images = [
+            _open_image_for_smolvlm(image_path, longest_edge)
+            for image_path in image_paths
+        ]
         
-        # Create prompt for vision model
+        # Create prompt for vision model, one conversation per image
         messages = [{
             "role": "user",
             "content": [
@@ -316,68 +689,142 @@ def process_huggingface_model(
             ]
         }]
         
-        # Process inputs
+        # Process inputs; every image shares the same prompt template
         text_input = processor.apply_chat_template(
             messages, 
             add_generation_prompt=True
         )
+        # The prompt expands to one image token per tile, so sequence lengths
+        # differ between images; a single image has nothing to pad against
         inputs = processor(
-            text=text_input,
-            images=[image],
+            text=[text_input] * len(images),
+            images=[[image] for image in images],
             return_tensors="pt",
-            padding=True
+            padding="longest" if len(images) > 1 else False
         )
         
-        # Move to device if GPU available
-        if torch.cuda.is_available():
-            inputs = {k: v.to(vision_model.device) for k, v in inputs.items()}
+        # Move to device if GPU available. Pinned host memory lets the copies
+        # run as asynchronous DMA; they are queued on the same stream as
+        # generate(), so no explicit synchronisation is needed
+        if use_cuda:
+            for k, v in inputs.items():
+                inputs[k] = v.pin_memory()
+            inputs = inputs.to(vision_model.device, non_blocking=True)
         
-        # Generate response
-        with torch.no_grad():
+        # Generate responses for the whole batch at once
+        with torch.inference_mode():
             generated_ids = vision_model.generate(
                 **inputs,
-                max_new_tokens=MAX_TOKENS,
+                max_new_tokens=max_new_tokens,
                 do_sample=False
             )
         
-        # Decode response
-        generated_text = processor.batch_decode(
+        # Decode responses; prompts are left-padded to a common length
+        return processor.batch_decode(
             generated_ids[:, inputs["input_ids"].shape[1]:],
             skip_special_tokens=True
-        )[0]
-        
-        # Display result
-        typer.echo("\n🎉 Text extraction completed!")
-        typer.echo("=" * 50)
-        typer.echo(generated_text.strip())
-        typer.echo("=" * 50)
+        )
         
     except ImportError as e:
         raise Exception(f"Hugging Face dependencies missing: {e}")
 
 
-def process_with_tools(
+def display_huggingface_result(generated_text: str) -> None:
+    """
+    Display text extracted by the SmolVLM model.
+    
+    Args:
+        generated_text: Decoded model output
+    """
+    typer.echo("\n🎉 Text extraction completed!")
+    typer.echo("=" * 50)
+    typer.echo(generated_text.strip())
+    typer.echo("=" * 50)
+
+
+def process_huggingface_model(
     image_path: str, 
     prompt: str, 
-    llm_with_tools
+    model: str,
+    compile_model: bool = False
 ) -> None:
     """
-    Process image using tool-based approach (OpenAI/Ollama).
+    Process image using Hugging Face SmolVLM model.
     
     Args:
         image_path: Path to image file
         prompt: User prompt for processing
-        llm_with_tools: Configured LLM with tools
+        model: Model name to use
+        compile_model: Compile the model with torch.compile
     """
-    react_graph = create_graph(llm_with_tools)
+    generated_text = process_huggingface_model_batch(
+        [image_path], prompt, model, compile_model
+    )[0]
+    display_huggingface_result(generated_text)
+
+
+def run_with_tools(
+    image_path: str, 
+    prompt: str, 
+    react_graph
+) -> Dict[str, Any]:
+    """
+    Run the tool-based agent (OpenAI/Ollama) on an image.
     
+    Args:
+        image_path: Path to image file
+        prompt: User prompt for processing
+        react_graph: Compiled agent graph
+        
+    Returns:
+        Final agent state
+    """
     messages = [HumanMessage(content=prompt)]
-    result = react_graph.invoke({
+    return react_graph.invoke({
         "messages": messages,
         "input_file": image_path
     })
+
+
+def run_with_tools_batch(
+    image_paths: List[str],
+    prompt: str,
+    react_graph,
+    max_concurrency: int = BATCH_MAX_WORKERS
+) -> List[Union[Dict[str, Any], Exception]]:
+    """
+    Run the tool-based agent (OpenAI/Ollama) on several images at once.
+    
+    The runs go through the graph's batch() API, which executes them
+    concurrently on a shared LLM client.
     
-    # Display result
+    Args:
+        image_paths: Paths to image files
+        prompt: User prompt for processing
+        react_graph: Compiled agent graph
+        max_concurrency: Maximum number of agent runs in flight
+        
+    Returns:
+        Final agent state per image, or the exception that image raised
+    """
+    states = [
+        {"messages": [HumanMessage(content=prompt)], "input_file": image_path}
+        for image_path in image_paths
+    ]
+    return react_graph.batch(
+        states,
+        config={"max_concurrency": max_concurrency},
+        return_exceptions=True
+    )
+
+
+def display_tool_result(result: Dict[str, Any]) -> None:
+    """
+    Display the final message of a tool-based agent run.
+    
+    Args:
+        result: Final agent state returned by the graph
+    """
     if result and "messages" in result and result["messages"]:
         final_message = result["messages"][-1]
         if hasattr(final_message, 'content'):
@@ -391,6 +838,23 @@ def process_with_tools(
         typer.echo("⚠️  No response received from the AI model")
 
 
+def process_with_tools(
+    image_path: str, 
+    prompt: str, 
+    react_graph
+) -> None:
+    """
+    Process image using tool-based approach (OpenAI/Ollama).
+    
+    Args:
+        image_path: Path to image file
+        prompt: User prompt for processing
+        react_graph: Compiled agent graph
+    """
+    result = run_with_tools(image_path, prompt, react_graph)
+    display_tool_result(result)
+
+
 def validate_image_file(image_path: str) -> None:
     """
     Validate that the image file exists and has valid extension.
@@ -401,14 +865,16 @@ def validate_image_file(image_path: str) -> None:
     Raises:
         typer.Exit: If file doesn't exist or user cancels
     """
-    # Check if file exists
-    if not Path(image_path).exists():
+    # Check if file exists (one stat call, no Path objects)
+    try:
+        os.stat(image_path)
+    except OSError:
         typer.echo(f"❌ Error: Image file not found: {image_path}", err=True)
         typer.echo("💡 Please check the file path and try again", err=True)
         raise typer.Exit(1)
     
     # Check file extension
-    if Path(image_path).suffix.lower() not in VALID_IMAGE_EXTENSIONS:
+    if os.path.splitext(image_path)[1].lower() not in VALID_IMAGE_EXTENSIONS:
         typer.echo(f"⚠️  Warning: '{image_path}' may not be a valid "
                   "image file", err=True)
         if not typer.confirm("Continue anyway?"):
@@ -470,8 +936,8 @@ def handle_processing_error(error: Exception, provider: str) -> None:
 
 @app.command()
 def main_command(
-    image_input: str = typer.Argument(
-        ..., 
+    image_input: Optional[str] = typer.Argument(
+        None, 
         help="Path to local image file or URL to image online"
     ),
     prompt: str = typer.Option(
@@ -488,6 +954,33 @@ def main_command(
         None, 
         "--model",
         help="Specific model name (e.g., 'gpt-4o', 'llava:7b')"
+    ),
+    batch_file: Optional[str] = typer.Option(
+        None,
+        "--batch-file", "-b",
+        help="File with one image path or URL per line to process together"
+    ),
+    parallel_tools: bool = typer.Option(
+        True,
+        "--parallel-tools/--no-parallel-tools",
+        help="Allow OpenAI to make several extraction tool calls at once"
+    ),
+    hf_batch_size: int = typer.Option(
+        HF_BATCH_SIZE,
+        "--hf-batch-size",
+        min=1,
+        help="Images per SmolVLM generate() call in batch mode"
+    ),
+    compile_model: bool = typer.Option(
+        False,
+        "--compile/--no-compile",
+        help="Compile SmolVLM with torch.compile (slow first image, faster after)"
+    ),
+    use_async: bool = typer.Option(
+        False,
+        "--async",
+        help="Run downloads and agent calls on one event loop "
+             "(openai/ollama only)"
     )
 ) -> None:
     """
@@ -511,15 +1004,66 @@ def main_command(
         # Custom prompts with URLs
         python main.py https://example.com/receipt.jpg \\
             --prompt "Extract all prices"
+        
+        # Many images at once (one path or URL per line)
+        python main.py --batch-file images.txt --provider openai
+        python main.py --batch-file images.txt --provider openai --async
     """
-    extract_text_from_image(image_input, prompt, provider, model)
+    # Progress goes to stderr through logging; extracted text stays on stdout.
+    # force=True rebinds the handler to the current stderr on every call
+    log_level_name = os.getenv("LOG_LEVEL", "INFO").upper()
+    # getLevelName maps a known name to its number and anything else to a
+    # string; getLevelNamesMapping() would need Python 3.11
+    log_level = logging.getLevelName(log_level_name)
+    logging.basicConfig(
+        level=log_level if isinstance(log_level, int) else logging.INFO,
+        format="%(message)s",
+        stream=sys.stderr,
+        force=True
+    )
+    if not isinstance(log_level, int):
+        log.warning(f"⚠️  Unknown LOG_LEVEL '{log_level_name}', using INFO")
+    
+    if batch_file is None and image_input is None:
+        raise typer.BadParameter(
+            "Provide an IMAGE_INPUT or use --batch-file",
+            param_hint="'IMAGE_INPUT'"
+        )
+    
+    # The local SmolVLM model has no async path; it always runs in-process
+    if use_async and provider.lower() != "huggingface":
+        inputs = [image_input] if image_input else []
+        if batch_file is not None:
+            inputs.extend(read_batch_file(batch_file))
+        asyncio.run(extract_text_from_images_async(
+            inputs, prompt, provider, model, parallel_tools
+        ))
+        return
+    
+    if batch_file is None:
+        extract_text_from_image(
+            image_input, prompt, provider, model, parallel_tools,
+            compile_model=compile_model
+        )
+        return
+    
+    inputs = [image_input] if image_input else []
+    inputs.extend(read_batch_file(batch_file))
+    extract_text_from_images(
+        inputs, prompt, provider, model,
+        parallel_tools=parallel_tools,
+        hf_batch_size=hf_batch_size,
+        compile_model=compile_model
+    )
 
 
 def extract_text_from_image(
     image_input: str, 
     prompt: str, 
     provider: str, 
-    model: Optional[str]
+    model: Optional[str],
+    parallel_tools: bool = True,
+    compile_model: bool = False
 ) -> None:
     """
     Core function to extract text from image (local file or URL).
@@ -529,14 +1073,20 @@ def extract_text_from_image(
         prompt: User prompt for processing
         provider: AI provider to use
         model: Specific model name (optional)
+        parallel_tools: Allow parallel tool calls (OpenAI only)
+        compile_model: Compile SmolVLM with torch.compile (huggingface only)
     """
     temp_file_path: Optional[str] = None
     
     try:
         # Handle URL input
         if is_url(image_input):
-            typer.echo(f"🌐 Processing image from URL: {image_input}")
-            temp_file_path = download_image_from_url(image_input)
+            log.info(f"🌐 Processing image from URL: {image_input}")
+            if provider.lower() == "huggingface":
+                temp_file_path = download_image_from_url(image_input)
+            else:
+                # The tools send the image as base64; skip the temp file
+                temp_file_path = download_image_to_memory(image_input)
             image_path = temp_file_path
         else:
             # Handle local file input
@@ -548,18 +1098,23 @@ def extract_text_from_image(
             model = get_default_model(provider)
         
         # Display processing info
-        typer.echo(f"🔍 Processing image: {image_path}")
-        typer.echo(f"💬 Using prompt: {prompt}")
-        typer.echo(f"🤖 Model provider: {provider}")
-        typer.echo(f"🧠 Model: {model}")
+        log.info(f"🔍 Processing image: {image_path}")
+        log.info(f"💬 Using prompt: {prompt}")
+        log.info(f"🤖 Model provider: {provider}")
+        log.info(f"🧠 Model: {model}")
         
         # Process based on provider
         if provider.lower() == "huggingface":
-            process_huggingface_model(image_path, prompt, model)
+            process_huggingface_model(
+                image_path, prompt, model, compile_model
+            )
         else:
-            # Get LLM and process with tools
-            llm_with_tools = get_llm_with_tools(provider, model)
-            process_with_tools(image_path, prompt, llm_with_tools)
+            # Get the (cached) agent graph and process with tools
+            react_graph = _get_compiled_graph(provider, model, parallel_tools)
+            # The provider and model are valid; start loading the extraction
+            # model so its cold start overlaps with the agent's first turn
+            warm_up_vision_llm()
+            process_with_tools(image_path, prompt, react_graph)
             
     except Exception as e:
         handle_processing_error(e, provider)
@@ -571,5 +1126,279 @@ def extract_text_from_image(
             cleanup_temp_file(temp_file_path)
 
 
+
+def read_batch_file(batch_file: str) -> List[str]:
+    """
+    Read image inputs from a batch file.
+    
+    Args:
+        batch_file: Path to a file with one image path or URL per line;
+            blank lines and lines starting with '#' are ignored
+        
+    Returns:
+        List of image inputs in file order
+        
+    Raises:
+        typer.Exit: If the file cannot be read
+    """
+    try:
+        with open(batch_file, encoding="utf-8") as f:
+            lines = [line.strip() for line in f]
+    except OSError as e:
+        typer.echo(f"❌ Error: Could not read batch file: {e}", err=True)
+        raise typer.Exit(1)
+    
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+def extract_text_from_images(
+    inputs: List[str],
+    prompt: str,
+    provider: str,
+    model: Optional[str],
+    max_workers: int = BATCH_MAX_WORKERS,
+    parallel_tools: bool = True,
+    hf_batch_size: int = HF_BATCH_SIZE,
+    compile_model: bool = False
+) -> None:
+    """
+    Extract text from several images (local files or URLs) in one run.
+    
+    URL inputs are downloaded concurrently, the LLM is configured once, and
+    the per-image agent runs for tool-based providers are submitted together
+    through the graph's batch API. Results are displayed in input order. A
+    failure on one image does not stop the others.
+    
+    Args:
+        inputs: Paths to local files or URLs
+        prompt: User prompt for processing
+        provider: AI provider to use
+        model: Specific model name (optional)
+        max_workers: Maximum concurrent downloads/requests
+        parallel_tools: Allow parallel tool calls (OpenAI only)
+        hf_batch_size: Images per generate() call (huggingface only)
+        compile_model: Compile SmolVLM with torch.compile (huggingface only)
+        
+    Raises:
+        typer.Exit: If any image failed to process
+    """
+    if model is None:
+        model = get_default_model(provider)
+    
+    is_huggingface = provider.lower() == "huggingface"
+    if not is_huggingface:
+        # Only start loading the extraction model once the provider and
+        # model are known to be usable; it then loads during the downloads
+        try:
+            react_graph = _get_compiled_graph(provider, model, parallel_tools)
+        except Exception as e:
+            handle_processing_error(e, provider)
+            raise typer.Exit(1)
+        warm_up_vision_llm()
+    
+    log.info(f"📚 Processing {len(inputs)} images")
+    log.info(f"💬 Using prompt: {prompt}")
+    log.info(f"🤖 Model provider: {provider}")
+    log.info(f"🧠 Model: {model}")
+    
+    image_paths: Dict[str, str] = {}
+    temp_file_paths: List[str] = []
+    failed = 0
+    
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Start all downloads at once, then validate local files. Only
+            # SmolVLM needs the image on disk; the tools read it from memory
+            download = (download_image_from_url if is_huggingface
+                        else download_image_to_memory)
+            # A URL listed twice is downloaded once and shares its copy;
+            # a second download would be orphaned and never cleaned up
+            downloads = {
+                image_input: executor.submit(download, image_input)
+                for image_input in dict.fromkeys(
+                    i for i in inputs if is_url(i)
+                )
+            }
+            for image_input in inputs:
+                if image_input in downloads:
+                    continue
+                try:
+                    validate_image_file(image_input)
+                    image_paths[image_input] = image_input
+                except typer.Exit:
+                    failed += 1
+            
+            for image_input, future in downloads.items():
+                try:
+                    image_paths[image_input] = future.result()
+                    temp_file_paths.append(image_paths[image_input])
+                except Exception as e:
+                    typer.echo(f"❌ {image_input}: {str(e)}", err=True)
+                    failed += inputs.count(image_input)
+            
+            ready = [i for i in inputs if i in image_paths]
+            
+            if is_huggingface:
+                # The local model takes images in groups of hf_batch_size,
+                # one generate() call per group
+                for start in range(0, len(ready), hf_batch_size):
+                    group = ready[start:start + hf_batch_size]
+                    try:
+                        texts = process_huggingface_model_batch(
+                            [image_paths[image_input] for image_input in group],
+                            prompt,
+                            model,
+                            compile_model
+                        )
+                    except Exception as e:
+                        handle_processing_error(e, provider)
+                        failed += len(group)
+                        continue
+                    for image_input, generated_text in zip(group, texts):
+                        typer.echo(f"\n📄 {image_input}")
+                        display_huggingface_result(generated_text)
+            else:
+                results = run_with_tools_batch(
+                    [image_paths[image_input] for image_input in ready],
+                    prompt,
+                    react_graph,
+                    max_concurrency=max_workers
+                )
+                for image_input, result in zip(ready, results):
+                    typer.echo(f"\n📄 {image_input}")
+                    if isinstance(result, Exception):
+                        handle_processing_error(result, provider)
+                        failed += 1
+                    else:
+                        display_tool_result(result)
+    
+    except Exception as e:
+        handle_processing_error(e, provider)
+        raise typer.Exit(1)
+    
+    finally:
+        for temp_file_path in temp_file_paths:
+            cleanup_temp_file(temp_file_path)
+    
+    if failed:
+        typer.echo(f"\n⚠️  {failed} of {len(inputs)} images failed", err=True)
+        raise typer.Exit(1)
+
+
+async def extract_text_from_image_async(
+    image_input: str,
+    prompt: str,
+    provider: str,
+    model: str,
+    parallel_tools: bool = True
+) -> Dict[str, Any]:
+    """
+    Run the tool-based agent (OpenAI/Ollama) on one image without blocking.
+    
+    The download runs in a worker thread and the agent runs through the
+    graph's ainvoke(), so many calls can share one event loop.
+    
+    Args:
+        image_input: Path to local file or URL
+        prompt: User prompt for processing
+        provider: AI provider to use ('openai' or 'ollama')
+        model: Specific model name
+        parallel_tools: Allow parallel tool calls (OpenAI only)
+        
+    Returns:
+        Final agent state
+        
+    Raises:
+        typer.Exit: If a local file is missing
+        Exception: If the download or agent run fails
+    """
+    temp_file_path: Optional[str] = None
+    
+    try:
+        if is_url(image_input):
+            temp_file_path = await asyncio.to_thread(
+                download_image_to_memory, image_input
+            )
+            image_path = temp_file_path
+        else:
+            image_path = image_input
+            validate_image_file(image_path)
+        
+        react_graph = _get_compiled_graph(provider, model, parallel_tools)
+        return await react_graph.ainvoke({
+            "messages": [HumanMessage(content=prompt)],
+            "input_file": image_path
+        })
+    
+    finally:
+        if temp_file_path:
+            cleanup_temp_file(temp_file_path)
+
+
+async def extract_text_from_images_async(
+    inputs: List[str],
+    prompt: str,
+    provider: str,
+    model: Optional[str],
+    parallel_tools: bool = True
+) -> None:
+    """
+    Extract text from several images concurrently on one event loop.
+    
+    Every image is downloaded and processed as its own task; results are
+    displayed in input order once all have finished. A failure on one image
+    does not stop the others.
+    
+    Args:
+        inputs: Paths to local files or URLs
+        prompt: User prompt for processing
+        provider: AI provider to use ('openai' or 'ollama')
+        model: Specific model name (optional)
+        parallel_tools: Allow parallel tool calls (OpenAI only)
+        
+    Raises:
+        typer.Exit: If any image failed to process
+    """
+    if model is None:
+        model = get_default_model(provider)
+    
+    # Only start loading the extraction model once the provider and model
+    # are known to be usable; it then loads during the downloads
+    try:
+        _get_compiled_graph(provider, model, parallel_tools)
+    except Exception as e:
+        handle_processing_error(e, provider)
+        raise typer.Exit(1)
+    warm_up_vision_llm()
+    
+    log.info(f"📚 Processing {len(inputs)} images")
+    log.info(f"💬 Using prompt: {prompt}")
+    log.info(f"🤖 Model provider: {provider}")
+    log.info(f"🧠 Model: {model}")
+    
+    results = await asyncio.gather(
+        *(extract_text_from_image_async(
+            image_input, prompt, provider, model, parallel_tools
+        ) for image_input in inputs),
+        return_exceptions=True
+    )
+    
+    failed = 0
+    for image_input, result in zip(inputs, results):
+        typer.echo(f"\n📄 {image_input}")
+        if isinstance(result, typer.Exit):
+            # validate_image_file has already reported the problem
+            failed += 1
+        elif isinstance(result, Exception):
+            handle_processing_error(result, provider)
+            failed += 1
+        else:
+            display_tool_result(result)
+    
+    if failed:
+        typer.echo(f"\n⚠️  {failed} of {len(inputs)} images failed", err=True)
+        raise typer.Exit(1)
+
+
 if __name__ == "__main__":
-    app()
+    app()
\ No newline at end of file